@@ -1,7 +1,7 @@
 from flask import Flask, render_template, request, jsonify
 import yaml
-import requests
 import json
+from endpoints import get_pool
 
 # Load configuration
 def load_config():
@@ -23,8 +23,7 @@ def chat():
     messages = data.get('messages')
     # call trainee endpoint
     try:
-        resp = requests.post(f"{trainee_conf['url']}/api/chat", json={"model":trainee_conf['model'], "messages":messages}, timeout=30)
-        resp.raise_for_status()
+        resp = get_pool(trainee_conf).post("/api/chat", json={"model":trainee_conf['model'], "messages":messages}, timeout=30)
         text = resp.text
         try:
             data_json = resp.json()
@@ -53,6 +52,10 @@ def chat():
         content = f"[Error] {e}"
     return jsonify({'reply': content})
 
+@app.route('/endpoints')
+def endpoints():
+    return jsonify(get_pool(trainee_conf).stats())
+
 if __name__ == '__main__':
     port = config.get('server', {}).get('port', 5000)
     app.run(port=port, debug=True)
@@ -4,12 +4,15 @@ sys.stdin.reconfigure(encoding='utf-8', errors='replace')
 sys.stdout.reconfigure(encoding='utf-8', errors='replace')
 sys.stderr.reconfigure(encoding='utf-8', errors='replace')
 
+import os
+import argparse
 import subprocess
 import yaml
 import random
 import time
 import threading
 import queue
+import recorder
 
 def load_config():
     with open('config.yaml', 'r') as f:
@@ -25,9 +28,21 @@ def load_starters(paths):
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Run an agent-vs-agent conversation.')
+    parser.add_argument('turns', nargs='?', type=int, default=10)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--record', metavar='PATH', help='record every LLM call to PATH')
+    group.add_argument('--replay', metavar='PATH', help='serve LLM calls from a recorded PATH, no network')
+    parser.add_argument('--speed', choices=['max', 'recorded'], default='max', help='replay pacing')
+    args = parser.parse_args()
     config = load_config()
-    # optional turns arg
-    num_turns = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    num_turns = args.turns
+    # agents inherit the transcript mode through the environment
+    if args.record or args.replay:
+        os.environ[recorder.ENV_MODE] = 'record' if args.record else 'replay'
+        os.environ[recorder.ENV_PATH] = args.record or args.replay
+        os.environ[recorder.ENV_SPEED] = args.speed
+    recorder.get_transcript().start_session(config.get('seed'))
     starters = load_starters(config['conversation_files'])
     initial_msg = random.choice(starters)
     # sanitize initial_msg to ASCII on Windows console
@@ -72,12 +87,20 @@ def main():
                 # ignore other roles
                 continue
 
+        # surface why an agent exited, e.g. a replay that diverged from the recording
+        def report_exit(proc, name):
+            if proc.poll() is not None:
+                err = proc.stderr.read().strip().splitlines()
+                if err:
+                    print(f'{name} exited: {err[-1]}', flush=True)
+
         # send initial to trainee and await response
         trainee_proc.stdin.write(initial_msg + '\n')
         trainee_proc.stdin.flush()
         role, msg = get_message('trainee', timeout=10)
         if msg is None:
             print('Trainee did not respond.', flush=True)
+            report_exit(trainee_proc, 'Trainee')
             return
         tr_safe = msg.encode(sys.stdout.encoding, 'replace').decode(sys.stdout.encoding)
         print(f'Trainee: {tr_safe}', flush=True)
@@ -89,6 +112,7 @@ def main():
             role, partner_resp = get_message('partner', timeout=10)
             if partner_resp is None:
                 print('Partner did not respond.', flush=True)
+                report_exit(partner_proc, 'Partner')
                 break
             pr_safe = partner_resp.encode(sys.stdout.encoding, 'replace').decode(sys.stdout.encoding)
             print(f'Partner: {pr_safe}', flush=True)
@@ -99,6 +123,7 @@ def main():
             role, msg = get_message('trainee', timeout=10)
             if msg is None:
                 print('Trainee did not respond.', flush=True)
+                report_exit(trainee_proc, 'Trainee')
                 break
             tr_safe2 = msg.encode(sys.stdout.encoding, 'replace').decode(sys.stdout.encoding)
             print(f'Trainee: {tr_safe2}', flush=True)
@@ -0,0 +1,175 @@
+import json
+import threading
+import time
+import logging
+import requests
+
+
+class Endpoint:
+    def __init__(self, url, weight=1, max_concurrency=None):
+        self.url = url.rstrip("/")
+        self.weight = max(float(weight), 1e-6)
+        self.max_concurrency = max_concurrency
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.ewma_latency = None
+
+    def available(self, now):
+        if self.ejected_until > now:
+            return False
+        return self.max_concurrency is None or self.outstanding < self.max_concurrency
+
+    def load(self):
+        # Least outstanding requests first; when those tie (always, for serial
+        # callers) the fewest requests per unit weight spreads traffic in
+        # proportion to the weights, and EWMA latency breaks any remaining tie
+        return (self.outstanding / self.weight, self.requests / self.weight, self.ewma_latency or 0.0)
+
+
+class EndpointPool:
+    """Routes requests for one role across several LLM hosts.
+
+    Each request goes to the healthy host with the fewest outstanding
+    requests relative to its weight; ties are split in proportion to the
+    weights, so serial callers still use every host. A host that fails ``max_failures``
+    times in a row is ejected for ``eject_seconds`` and then retried.
+    """
+
+    def __init__(self, endpoints, max_failures=3, eject_seconds=30, ewma_alpha=0.3):
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        self.endpoints = [Endpoint(**e) for e in endpoints]
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.ewma_alpha = ewma_alpha
+        self.cond = threading.Condition()
+
+    @classmethod
+    def from_config(cls, role_conf):
+        """Build a pool from a role section with either ``url`` or an ``endpoints`` list."""
+        entries = role_conf.get("endpoints") or [role_conf["url"]]
+        endpoints = []
+        for e in entries:
+            if isinstance(e, str):
+                endpoints.append({"url": e})
+            else:
+                endpoints.append({"url": e["url"], "weight": e.get("weight", 1), "max_concurrency": e.get("max_concurrency")})
+        health = role_conf.get("health", {})
+        return cls(endpoints, max_failures=health.get("max_failures", 3), eject_seconds=health.get("eject_seconds", 30))
+
+    def _acquire(self, exclude):
+        with self.cond:
+            while True:
+                now = time.time()
+                candidates = [e for e in self.endpoints if e not in exclude]
+                if not candidates:
+                    return None
+                ready = [e for e in candidates if e.available(now)]
+                if not ready:
+                    # Every host ejected: fall back to the one due back soonest
+                    if all(e.ejected_until > now for e in candidates):
+                        ready = [min(candidates, key=lambda e: e.ejected_until)]
+                    else:
+                        self.cond.wait(timeout=1)
+                        continue
+                ep = min(ready, key=Endpoint.load)
+                ep.outstanding += 1
+                ep.requests += 1
+                return ep
+
+    def _release(self, ep, latency, ok):
+        with self.cond:
+            ep.outstanding -= 1
+            ep.total_latency += latency
+            if ep.ewma_latency is None:
+                ep.ewma_latency = latency
+            else:
+                ep.ewma_latency = self.ewma_alpha * latency + (1 - self.ewma_alpha) * ep.ewma_latency
+            if ok:
+                ep.failures = 0
+                ep.ejected_until = 0.0
+            else:
+                ep.errors += 1
+                ep.failures += 1
+                if ep.failures >= self.max_failures:
+                    ep.ejected_until = time.time() + self.eject_seconds
+                    logging.warning(f"Ejecting endpoint {ep.url} for {self.eject_seconds}s after {ep.failures} failures")
+            self.cond.notify_all()
+
+    def post(self, path, json=None, timeout=10):
+        """POST to path on the best host, failing over to the others on error.
+
+        Only connection errors, timeouts and 5xx responses count against a
+        host; a 4xx is the request's fault and is raised straight away.
+        """
+        tried = []
+        last_error = None
+        while True:
+            ep = self._acquire(tried)
+            if ep is None:
+                raise last_error
+            tried.append(ep)
+            start = time.time()
+            try:
+                resp = requests.post(f"{ep.url}{path}", json=json, timeout=timeout)
+                if resp.status_code >= 500:
+                    resp.raise_for_status()
+            except requests.RequestException as e:
+                self._release(ep, time.time() - start, ok=False)
+                logging.info(f"Endpoint {ep.url} failed: {e}")
+                last_error = e
+                continue
+            except Exception:
+                self._release(ep, time.time() - start, ok=True)
+                raise
+            self._release(ep, time.time() - start, ok=True)
+            resp.raise_for_status()
+            return resp
+
+    def stats(self):
+        now = time.time()
+        with self.cond:
+            return [{
+                "url": e.url,
+                "weight": e.weight,
+                "outstanding": e.outstanding,
+                "requests": e.requests,
+                "errors": e.errors,
+                "avg_latency": e.total_latency / e.requests if e.requests else None,
+                "ewma_latency": e.ewma_latency,
+                "healthy": e.ejected_until <= now,
+            } for e in self.endpoints]
+
+    def report(self):
+        lines = []
+        for s in self.stats():
+            avg = f"{s['avg_latency']:.2f}s" if s["avg_latency"] is not None else "n/a"
+            state = "up" if s["healthy"] else "ejected"
+            lines.append(f"{s['url']}: {s['requests']} req, {s['errors']} err, avg {avg}, {state}")
+        return "\n".join(lines)
+
+
+def post_chat(target, payload, timeout=10):
+    """POST an /api/chat payload for a role config or URL and return the decoded JSON body."""
+    return get_pool(target).post("/api/chat", json=payload, timeout=timeout).json()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(target):
+    """Return the shared pool for a role config dict or a bare URL string.
+
+    Pools are keyed by the whole role section, so two roles that point at
+    the same hosts still get their own weights, limits, health and stats.
+    """
+    role_conf = {"url": target} if isinstance(target, str) else target
+    key = json.dumps(role_conf, sort_keys=True, default=str)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = EndpointPool.from_config(role_conf)
+        return _pools[key]
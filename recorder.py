@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+
+# Environment overrides so bridge.py can pass the mode to its agent subprocesses
+ENV_MODE = "SYSTEMFORGE_TRANSCRIPT_MODE"
+ENV_PATH = "SYSTEMFORGE_TRANSCRIPT_PATH"
+ENV_SPEED = "SYSTEMFORGE_TRANSCRIPT_SPEED"
+
+
+class ReplayMiss(KeyError):
+    """A replayed run asked for a request that was never recorded."""
+
+
+class Transcript:
+    """Records LLM chat calls to an append-only JSON Lines file, or replays them.
+
+    Each line holds the hash of the request payload, the response body (or
+    the error raised) and the call's timing. Every run appends a session
+    header followed by its calls; existing content is never truncated. In
+    replay mode the last session's responses are served by request hash in
+    recorded order, with no network, either as fast as possible or paced
+    by the recorded durations. A request with no recording raises
+    ReplayMiss, since the run has diverged from the one recorded.
+    """
+
+    def __init__(self, mode=None, path=None, speed="max"):
+        if mode not in (None, "record", "replay"):
+            raise ValueError(f"Unknown transcript mode: {mode}")
+        self.mode = mode
+        self.path = path
+        self.speed = speed
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.seed = None
+        self.replies = {}
+        if mode == "replay":
+            self._load()
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry.get("type") == "session":
+                    # Only the most recent session is replayed
+                    self.seed = entry["seed"]
+                    self.replies = {}
+                    continue
+                self.replies.setdefault(entry["k"], []).append(entry)
+
+    def _append(self, entry):
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def start_session(self, seed=None):
+        """Seed the RNG for a run; the seed is stored in record mode and reused in replay."""
+        if self.mode == "replay" and self.seed is not None:
+            seed = self.seed
+        elif seed is None:
+            seed = random.randrange(2 ** 32)
+        if self.mode == "record":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._append({"type": "session", "seed": seed})
+        random.seed(seed)
+        return seed
+
+    @staticmethod
+    def request_key(payload):
+        return hashlib.sha1(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def chat(self, send, payload):
+        """Return send(payload), recording or replaying it according to the mode."""
+        if self.mode is None:
+            return send(payload)
+        key = self.request_key(payload)
+        if self.mode == "replay":
+            with self.lock:
+                entries = self.replies.get(key)
+                if not entries:
+                    raise ReplayMiss(f"No recorded response for request {key[:12]}; replay has diverged")
+                # Repeat the last recorded reply once a request's replies run out
+                entry = entries.pop(0) if len(entries) > 1 else entries[0]
+            if self.speed == "recorded":
+                time.sleep(entry["dt"])
+            if "err" in entry:
+                raise RuntimeError(entry["err"])
+            return entry["res"]
+        t = time.time()
+        try:
+            result = send(payload)
+        except Exception as e:
+            self._append({"k": key, "model": payload.get("model"), "t": round(t - self.start, 4), "dt": round(time.time() - t, 4), "err": str(e)})
+            raise
+        self._append({"k": key, "model": payload.get("model"), "t": round(t - self.start, 4), "dt": round(time.time() - t, 4), "res": result})
+        return result
+
+
+_transcript = None
+
+def get_transcript(conf=None):
+    """Return the process-wide transcript, configured from conf and the environment on first use.
+
+    Only train_rl passes the transcript section of config.yaml; bridge.py and
+    the agents are driven by the environment alone.
+    """
+    global _transcript
+    if _transcript is None:
+        conf = conf or {}
+        mode = os.environ.get(ENV_MODE, conf.get("mode")) or None
+        path = os.environ.get(ENV_PATH, conf.get("path", os.path.join("logs", "transcript.jsonl")))
+        speed = os.environ.get(ENV_SPEED, conf.get("speed", "max"))
+        _transcript = Transcript(mode, path, speed)
+    return _transcript
@@ -0,0 +1,342 @@
+import re
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import Counter, OrderedDict
+
+# Shared response features: name -> (dependencies, extractor)
+FEATURES = {}
+# Rule families keyed by their section name in scoring_rules.json
+SCORERS = {}
+
+BASE_SCORE = 5
+
+
+def feature(name, deps=()):
+    def register(fn):
+        FEATURES[name] = (tuple(deps), fn)
+        return fn
+    return register
+
+
+def scoring_rule(name, needs=()):
+    """Register a rule family that scores the ``name`` section of the rules.
+
+    The function receives the computed features and its rules section and
+    returns its contribution to the score.
+    """
+    def register(fn):
+        SCORERS[name] = {"fn": fn, "needs": tuple(needs)}
+        return fn
+    return register
+
+
+@feature("lower")
+def _lower(f):
+    return f["response"].lower()
+
+@feature("words")
+def _words(f):
+    return f["response"].split()
+
+@feature("lower_words", deps=("lower",))
+def _lower_words(f):
+    return f["lower"].split()
+
+@feature("lower_word_set", deps=("lower_words",))
+def _lower_word_set(f):
+    return set(f["lower_words"])
+
+@feature("lower_word_counts", deps=("lower_words",))
+def _lower_word_counts(f):
+    return Counter(f["lower_words"])
+
+@feature("sentence_lengths")
+def _sentence_lengths(f):
+    sentences = re.split(r'[.!?]+', f["response"])
+    return [len(s.split()) for s in sentences if s.strip()]
+
+@feature("partner_word_set")
+def _partner_word_set(f):
+    return set(f["partner_message"].lower().split()) if f["partner_message"] else set()
+
+
+def _compute(name, feats):
+    if name in feats:
+        return
+    deps, fn = FEATURES[name]
+    for dep in deps:
+        _compute(dep, feats)
+    feats[name] = fn(feats)
+
+
+def enabled_scorers(rules):
+    return [name for name in SCORERS if name in rules and rules[name].get("enabled", True)]
+
+
+def score_response(response, partner_message, rules, stats=None):
+    """Score one trainee response with every rule family enabled in rules.
+
+    Features needed by the enabled families are computed once up front. If
+    a stats dict is passed, per-family call counts, time and contribution
+    are accumulated into it.
+    """
+    names = enabled_scorers(rules)
+    feats = {"response": response, "partner_message": partner_message}
+    for name in names:
+        for need in SCORERS[name]["needs"]:
+            _compute(need, feats)
+    score = BASE_SCORE
+    for name in names:
+        start = time.perf_counter()
+        delta = SCORERS[name]["fn"](feats, rules[name])
+        score += delta
+        if stats is not None:
+            entry = stats.setdefault(name, {"calls": 0, "cached": 0, "time": 0.0, "contribution": 0})
+            entry["calls"] += 1
+            entry["time"] += time.perf_counter() - start
+            entry["contribution"] += delta
+    return score
+
+
+def scorer_report(stats):
+    lines = []
+    for name, s in sorted(stats.items(), key=lambda kv: -kv[1]["time"]):
+        avg = s["contribution"] / s["calls"] if s["calls"] else 0
+        lines.append(f"{name}: {s['time'] * 1000:.2f}ms total, contribution {s['contribution']:+} (avg {avg:+.2f}) over {s['calls']} calls ({s.get('cached', 0)} cached)")
+    return "\n".join(lines)
+
+
+def _count_phrases(lower, phrases):
+    return sum(lower.count(p.lower()) for p in phrases)
+
+
+@scoring_rule("length", needs=("words",))
+def score_length(f, r):
+    word_count = len(f["words"])
+    if word_count < r["min_words"]:
+        return r.get("too_short_penalty", -2)
+    if word_count > r["max_words"]:
+        return r.get("too_long_penalty", -1)
+    return 0
+
+@scoring_rule("repetition", needs=("lower_words", "lower_word_set"))
+def score_repetition(f, r):
+    if len(f["lower_word_set"]) < len(f["lower_words"]) * r["max_repeat_ratio"]:
+        return r.get("repeat_penalty", -1)
+    return 0
+
+@scoring_rule("conversational_markers", needs=("lower",))
+def score_conversational_markers(f, r):
+    if any(c.lower() in f["lower"] for c in r["contractions"]):
+        return r.get("contraction_reward", 1)
+    return 0
+
+@scoring_rule("question")
+def score_question(f, r):
+    return r.get("reward", 1) if '?' in f["response"] else 0
+
+@scoring_rule("on_topic", needs=("lower_word_set", "partner_word_set"))
+def score_on_topic(f, r):
+    if not f["partner_message"]:
+        return 0
+    if f["partner_word_set"] & f["lower_word_set"]:
+        return r.get("keyword_overlap_reward", 1)
+    return r.get("no_overlap_penalty", -1)
+
+@scoring_rule("originality")
+def score_originality(f, r):
+    partner = f["partner_message"]
+    if partner and f["response"].strip().lower() == partner.strip().lower():
+        return r.get("copy_penalty", -2)
+    return 0
+
+@scoring_rule("typos", needs=("lower",))
+def score_typos(f, r):
+    typo_count = _count_phrases(f["lower"], r.get("common_typos", []))
+    if typo_count >= r.get("min_typos", 0):
+        return min(typo_count * r.get("reward_per_typo", 0), r.get("max_reward", 0))
+    return 0
+
+@scoring_rule("hedging", needs=("lower",))
+def score_hedging(f, r):
+    hedge_count = _count_phrases(f["lower"], r.get("phrases", []))
+    hedge_count = min(hedge_count, r.get("max_count", hedge_count))
+    return hedge_count * r.get("reward_per", 0)
+
+@scoring_rule("back_channel", needs=("lower",))
+def score_back_channel(f, r):
+    bc_count = _count_phrases(f["lower"], r.get("phrases", []))
+    return min(bc_count * r.get("reward_per", 0), r.get("max_reward", 0))
+
+@scoring_rule("punctuation_variety")
+def score_punctuation_variety(f, r):
+    used_puncts = set(p for p in r.get("punctuations", []) if p in f["response"])
+    return r.get("reward", 0) if len(used_puncts) >= r.get("min_variety", 0) else 0
+
+@scoring_rule("emojis")
+def score_emojis(f, r):
+    # Per-item rewards, capped by max_reward
+    if not r:
+        return 0
+    total = sum(f["response"].count(item.get("emoji", "")) * item.get("reward", 0) for item in r.get("items", []))
+    return min(total, r.get("max_reward", float('inf')))
+
+@scoring_rule("sentence_length_diversity", needs=("sentence_lengths",))
+def score_sentence_length_diversity(f, r):
+    lengths = f["sentence_lengths"]
+    if len(lengths) > 1:
+        mean_len = sum(lengths) / len(lengths)
+        variance = sum((l - mean_len) ** 2 for l in lengths) / len(lengths)
+        if variance ** 0.5 >= r.get("min_std", float('inf')):
+            return r.get("reward", 0)
+    return 0
+
+@scoring_rule("personal_pronouns", needs=("lower_word_counts",))
+def score_personal_pronouns(f, r):
+    pp_count = sum(f["lower_word_counts"][w.lower()] for w in r.get("words", []))
+    return min(pp_count * r.get("reward_per", 0), r.get("max_reward", 0))
+
+@scoring_rule("contextual_callbacks", needs=("lower",))
+def score_contextual_callbacks(f, r):
+    cc_count = _count_phrases(f["lower"], r.get("phrases", []))
+    return min(cc_count * r.get("reward_per", 0), r.get("max_reward", 0))
+
+@scoring_rule("empathetic_markers", needs=("lower",))
+def score_empathetic_markers(f, r):
+    em_count = _count_phrases(f["lower"], r.get("phrases", []))
+    return min(em_count * r.get("reward_per", 0), r.get("max_reward", 0))
+
+@scoring_rule("follow_up_questions")
+def score_follow_up_questions(f, r):
+    # Additional questions beyond the first
+    fu_count = max(0, f["response"].count("?") - 1)
+    return min(fu_count * r.get("reward_per", 0), r.get("max_reward", 0))
+
+@scoring_rule("filler_words", needs=("lower_word_counts",))
+def score_filler_words(f, r):
+    fw_count = sum(f["lower_word_counts"][w.lower()] for w in r.get("words", []))
+    return max(r.get("max_penalty", 0), fw_count * r.get("penalty_per", 0))
+
+@scoring_rule("lexical_richness", needs=("lower_words", "lower_word_set"))
+def score_lexical_richness(f, r):
+    tokens = f["lower_words"]
+    if tokens and r and len(f["lower_word_set"]) / len(tokens) >= r.get("min_ratio", 1.0):
+        return r.get("reward", 0)
+    return 0
+
+@scoring_rule("readability", needs=("lower", "sentence_lengths"))
+def score_readability(f, r):
+    # Reward-only within sweet spot, skip on story markers
+    if not r or any(marker in f["lower"] for marker in r.get("story_markers", [])):
+        return 0
+    lengths = f["sentence_lengths"]
+    if lengths:
+        avg_len = sum(lengths) / len(lengths)
+        if r.get("min_len", 0) <= avg_len <= r.get("max_len", float('inf')):
+            return r.get("reward", 0)
+    return 0
+
+@scoring_rule("persona_consistency", needs=("lower",))
+def score_persona_consistency(f, r):
+    # Each listed phrase counts once when present in the response
+    lower = f["lower"]
+    reward = sum(p.get("reward", 0) for p in r.get("positive_phrases", []) if p["phrase"].lower() in lower)
+    penalty = sum(p.get("penalty", 0) for p in r.get("negative_phrases", []) if p["phrase"].lower() in lower)
+    return min(reward, r.get("max_reward", float('inf'))) + max(penalty, r.get("max_penalty", float('-inf')))
+
+
+class ScoreCache:
+    """Bounded LRU memo of score_response results.
+
+    Entries are keyed by a hash of the rules version, response and partner
+    message. Rules are loaded from ``rules_path``; reload_if_changed() picks
+    up edits to the file and drops every cached score when they change.
+    Per-family contributions are cached with each score so hits still show
+    up in the stats passed to score().
+    """
+
+    def __init__(self, rules_path, max_size=10000):
+        self.rules_path = rules_path
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rules = None
+        self.version = None
+        self.mtime = None
+        self.reload_if_changed()
+
+    def reload_if_changed(self):
+        """Reload the rules if the file changed; return True when they did.
+
+        An unreadable or half-saved file keeps the current rules (it is
+        retried on the next call) unless no rules have been loaded yet.
+        """
+        try:
+            mtime = os.path.getmtime(self.rules_path)
+            if mtime == self.mtime:
+                return False
+            with open(self.rules_path, "r", encoding="utf-8") as f:
+                text = f.read()
+            rules = json.loads(text)
+        except (OSError, ValueError) as e:
+            if self.rules is None:
+                raise
+            logging.warning(f"Could not reload {self.rules_path}, keeping current rules: {e}")
+            return False
+        self.mtime = mtime
+        version = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        if version == self.version:
+            return False
+        self.rules = rules
+        self.version = version
+        self.entries.clear()
+        return True
+
+    def score(self, response, partner_message, stats=None):
+        key = hashlib.sha1(f"{self.version}\0{response}\0{partner_message or ''}".encode("utf-8")).digest()
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            result, contributions = self.entries[key]
+            if stats is not None:
+                for name, delta in contributions.items():
+                    entry = stats.setdefault(name, {"calls": 0, "cached": 0, "time": 0.0, "contribution": 0})
+                    entry["calls"] += 1
+                    entry["cached"] += 1
+                    entry["contribution"] += delta
+            return result
+        self.misses += 1
+        miss_stats = {}
+        result = score_response(response, partner_message, self.rules, miss_stats)
+        contributions = {name: e["contribution"] for name, e in miss_stats.items()}
+        self.entries[key] = (result, contributions)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        if stats is not None:
+            for name, e in miss_stats.items():
+                entry = stats.setdefault(name, {"calls": 0, "cached": 0, "time": 0.0, "contribution": 0})
+                entry["calls"] += 1
+                entry["time"] += e["time"]
+                entry["contribution"] += e["contribution"]
+        return result
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self):
+        return f"{self.hits} hits, {self.misses} misses ({self.hit_rate():.1%}), {len(self.entries)}/{self.max_size} entries"
+
+
+_caches = {}
+
+def get_score_cache(rules_path, max_size=10000):
+    """Return the shared score cache for a rules file, so live and offline scoring reuse it."""
+    key = os.path.abspath(rules_path)
+    if key not in _caches:
+        _caches[key] = ScoreCache(rules_path, max_size)
+    return _caches[key]
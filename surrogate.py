@@ -0,0 +1,111 @@
+import math
+import random
+import re
+import zlib
+
+
+def ngram_features(msg, n_max=2, dims=2 ** 18):
+    """Hashed word n-gram term frequencies for a system message."""
+    words = re.findall(r"[a-z0-9']+", msg.lower())
+    counts = {}
+    for n in range(1, n_max + 1):
+        for i in range(len(words) - n + 1):
+            gram = " ".join(words[i:i + n])
+            key = zlib.crc32(gram.encode("utf-8")) % dims
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+class SurrogateModel:
+    """Linear TF-IDF regressor that predicts a system message's average score.
+
+    Pure Python and CPU only. Samples are added as candidates are evaluated
+    and the weights are refit with a few SGD passes once per epoch, so the
+    model never costs more than a fraction of one LLM call. Document
+    frequencies are snapshotted at fit time so predictions use the same
+    IDF scaling the weights were trained with.
+    """
+
+    def __init__(self, n_max=2, learning_rate=0.1, l2=1e-3, passes=20):
+        self.n_max = n_max
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.passes = passes
+        self.samples = []
+        self.doc_freq = {}
+        self.fit_doc_freq = {}
+        self.fit_docs = 0
+        self.weights = {}
+        self.bias = 0.0
+        self.fitted = False
+
+    def __len__(self):
+        return len(self.samples)
+
+    def _vectorize(self, counts):
+        n_docs = self.fit_docs + 1
+        vec = {}
+        for key, tf in counts.items():
+            idf = math.log(n_docs / (1 + self.fit_doc_freq.get(key, 0))) + 1
+            vec[key] = tf * idf
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {k: v / norm for k, v in vec.items()}
+
+    def add(self, msg, score):
+        counts = ngram_features(msg, self.n_max)
+        for key in counts:
+            self.doc_freq[key] = self.doc_freq.get(key, 0) + 1
+        self.samples.append((counts, score))
+
+    def fit(self):
+        if not self.samples:
+            return
+        self.fit_doc_freq = dict(self.doc_freq)
+        self.fit_docs = len(self.samples)
+        data = [(self._vectorize(counts), score) for counts, score in self.samples]
+        self.bias = sum(score for _, score in data) / len(data)
+        self.weights = {}
+        order = list(range(len(data)))
+        for _ in range(self.passes):
+            random.shuffle(order)
+            for i in order:
+                vec, score = data[i]
+                err = self._dot(vec) - score
+                for key, v in vec.items():
+                    w = self.weights.get(key, 0.0)
+                    self.weights[key] = w - self.learning_rate * (err * v + self.l2 * w)
+        self.fitted = True
+
+    def _dot(self, vec):
+        return self.bias + sum(self.weights.get(k, 0.0) * v for k, v in vec.items())
+
+    def predict(self, msg):
+        return self._dot(self._vectorize(ngram_features(msg, self.n_max)))
+
+
+def rank_correlation(predicted, actual):
+    """Spearman rank correlation between two equal-length score lists."""
+    if len(predicted) < 2:
+        return None
+
+    def ranks(values):
+        order = sorted(range(len(values)), key=lambda i: values[i])
+        r = [0.0] * len(values)
+        i = 0
+        while i < len(order):
+            j = i
+            while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+                j += 1
+            for k in range(i, j + 1):
+                r[order[k]] = (i + j) / 2
+            i = j + 1
+        return r
+
+    rp, ra = ranks(predicted), ranks(actual)
+    mp, ma = sum(rp) / len(rp), sum(ra) / len(ra)
+    cov = sum((p - mp) * (a - ma) for p, a in zip(rp, ra))
+    sp = math.sqrt(sum((p - mp) ** 2 for p in rp))
+    sa = math.sqrt(sum((a - ma) ** 2 for a in ra))
+    if not sp or not sa:
+        return None
+    return cov / (sp * sa)
@@ -1,6 +1,6 @@
 import logging
 logging.getLogger().setLevel(logging.WARNING)
-from train_rl import load_config, mutate_prompt
+from train_rl import load_config, mutate_prompt, message_hash
 import os
 import json
 
@@ -8,7 +8,7 @@ if __name__ == "__main__":
     # Load configuration
     config = load_config()
     prompt = config["trainee"]["system_message"]
-    url = config["trainee"]["url"]
+    endpoint = config["trainee"]
     model = config["trainee"]["model"]
     system_msg = config["trainee"]["system_message"]
 
@@ -17,11 +17,13 @@ if __name__ == "__main__":
     if os.path.exists(losers_file):
         with open(losers_file, "r", encoding="utf-8") as lf:
             previous = json.load(lf)
-        previous_msgs = {d.get("msg", "") for d in previous}
+        previous_hashes = {d.get("hash", "") for d in previous}
     else:
-        previous_msgs = set()
+        previous_hashes = set()
 
     # Generate a single prompt variant for testing
-    mutated_prompt, _ = mutate_prompt(prompt, url, model, system_msg)
+    mutated_prompt, _ = mutate_prompt(prompt, endpoint, model, system_msg)
     print(mutated_prompt)
+    if message_hash(mutated_prompt) in previous_hashes:
+        print("(matches a previous loser)")
     # End of test script
@@ -2,12 +2,17 @@ import yaml
 import json
 import time
 import os
-import requests
 from datetime import datetime
 import re
 import random
+import hashlib
+import string
 from difflib import SequenceMatcher
 import logging
+from surrogate import SurrogateModel, rank_correlation
+from endpoints import get_pool, post_chat
+from scoring import scorer_report, get_score_cache
+from recorder import get_transcript, ReplayMiss
 
 logging.basicConfig(level=logging.WARNING, force=True)  # Enable WARNING logs to console
 
@@ -15,10 +20,6 @@ def load_config():
     with open("config.yaml", "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
-def load_scoring_rules(path):
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
 def extract_starters(conversation_files):
     import re
     starters = []
@@ -43,136 +44,81 @@ def extract_starters(conversation_files):
         return ["Hello!"]
     return starters
 
-def score_response(response, partner_message, rules):
-    score = 5
-    word_count = len(response.split())
-    if word_count < rules["length"]["min_words"]:
-        score += rules["length"].get("too_short_penalty", -2)
-    elif word_count > rules["length"]["max_words"]:
-        score += rules["length"].get("too_long_penalty", -1)
-    words = response.lower().split()
-    if len(set(words)) < len(words) * rules["repetition"]["max_repeat_ratio"]:
-        score += rules["repetition"].get("repeat_penalty", -1)
-    contractions = rules["conversational_markers"]["contractions"]
-    found = any(c.lower() in response.lower() for c in contractions)
-    if found:
-        score += rules["conversational_markers"].get("contraction_reward", 1)
-    if '?' in response:
-        score += rules["question"].get("reward", 1)
-    if partner_message:
-        partner_keywords = set(partner_message.lower().split())
-        overlap = partner_keywords.intersection(set(words))
-        if overlap:
-            score += rules["on_topic"].get("keyword_overlap_reward", 1)
-        else:
-            score += rules["on_topic"].get("no_overlap_penalty", -1)
-    if partner_message and response.strip().lower() == partner_message.strip().lower():
-        score += rules["originality"].get("copy_penalty", -2)
-    # Typo reward
-    typo_rules = rules.get("typos", {})
-    common_typos = typo_rules.get("common_typos", [])
-    typo_count = sum(response.lower().count(t.lower()) for t in common_typos)
-    min_t = typo_rules.get("min_typos", 0)
-    max_t = typo_rules.get("max_typos", float('inf'))
-    reward_per = typo_rules.get("reward_per_typo", 0)
-    max_reward = typo_rules.get("max_reward", 0)
-    if typo_count >= min_t:
-        score += min(typo_count * reward_per, max_reward)
-
-    # Hedging
-    hedge_rules = rules.get("hedging", {})
-    hedges = hedge_rules.get("phrases", [])
-    hedge_count = sum(response.lower().count(h.lower()) for h in hedges)
-    hedge_count = min(hedge_count, hedge_rules.get("max_count", hedge_count))
-    score += hedge_count * hedge_rules.get("reward_per", 0)
-
-    # Back-channel
-    back_rules = rules.get("back_channel", {})
-    bc_phrases = back_rules.get("phrases", [])
-    bc_count = sum(response.lower().count(b.lower()) for b in bc_phrases)
-    score += min(bc_count * back_rules.get("reward_per", 0), back_rules.get("max_reward", 0))
-
-    # Punctuation variety
-    pv_rules = rules.get("punctuation_variety", {})
-    puncts = pv_rules.get("punctuations", [])
-    used_puncts = set(p for p in puncts if p in response)
-    if len(used_puncts) >= pv_rules.get("min_variety", 0):
-        score += pv_rules.get("reward", 0)
-
-    # Emojis (per-item rewards, capped by max_reward)
-    emoji_rules = rules.get("emojis", {})
-    if emoji_rules:
-        total_emoji_score = 0
-        for item in emoji_rules.get("items", []):
-            count = response.count(item.get("emoji", ""))
-            total_emoji_score += count * item.get("reward", 0)
-        score += min(total_emoji_score, emoji_rules.get("max_reward", float('inf')))
-
-    # Sentence length diversity
-    sld_rules = rules.get("sentence_length_diversity", {})
-    sentences = re.split(r'[.!?]+', response)
-    lengths = [len(s.split()) for s in sentences if s.strip()]
-    if len(lengths) > 1:
-        mean_len = sum(lengths) / len(lengths)
-        variance = sum((l - mean_len) ** 2 for l in lengths) / len(lengths)
-        std = variance ** 0.5
-        if std >= sld_rules.get("min_std", float('inf')):
-            score += sld_rules.get("reward", 0)
-
-    # Personal pronouns
-    pp_rules = rules.get("personal_pronouns", {})
-    pp_words = pp_rules.get("words", [])
-    pp_count = sum(response.lower().split().count(w.lower()) for w in pp_words)
-    score += min(pp_count * pp_rules.get("reward_per", 0), pp_rules.get("max_reward", 0))
-
-    # Contextual callbacks
-    cc_rules = rules.get("contextual_callbacks", {})
-    cc_phrases = cc_rules.get("phrases", [])
-    cc_count = sum(response.lower().count(p.lower()) for p in cc_phrases)
-    score += min(cc_count * cc_rules.get("reward_per", 0), cc_rules.get("max_reward", 0))
-
-    # Empathetic markers
-    em_rules = rules.get("empathetic_markers", {})
-    em_count = sum(response.lower().count(p.lower()) for p in em_rules.get("phrases", []))
-    score += min(em_count * em_rules.get("reward_per", 0), em_rules.get("max_reward", 0))
-
-    # Follow-up depth (additional questions)
-    fu_rules = rules.get("follow_up_questions", {})
-    q_total = response.count("?")
-    fu_count = max(0, q_total - 1)
-    score += min(fu_count * fu_rules.get("reward_per", 0), fu_rules.get("max_reward", 0))
-
-    # Filler-words penalty
-    fw_rules = rules.get("filler_words", {})
-    fw_words = fw_rules.get("words", [])
-    resp_words = response.lower().split()
-    fw_count = sum(resp_words.count(w.lower()) for w in fw_words)
-    score += max(fw_rules.get("max_penalty", 0), fw_count * fw_rules.get("penalty_per", 0))
-
-    # Lexical richness
-    lr_rules = rules.get("lexical_richness", {})
-    tokens = response.lower().split()
-    if tokens and lr_rules:
-        ratio = len(set(tokens)) / len(tokens)
-        if ratio >= lr_rules.get("min_ratio", 1.0):
-            score += lr_rules.get("reward", 0)
-
-    # Readability hybrid: reward-only within sweet spot, skip on story markers
-    read_rules = rules.get("readability", {})
-    if read_rules:
-        lower_resp = response.lower()
-        story_markers = read_rules.get("story_markers", [])
-        if not any(marker in lower_resp for marker in story_markers):
-            sentences = re.split(r'[.!?]+', response)
-            lengths = [len(s.split()) for s in sentences if s.strip()]
-            if lengths:
-                avg_len = sum(lengths) / len(lengths)
-                if read_rules.get("min_len", 0) <= avg_len <= read_rules.get("max_len", float('inf')):
-                    score += read_rules.get("reward", 0)
-
-    return score
-
-def mutate_prompt(prompt, url, model, system_msg):
+_PUNCT_TABLE = str.maketrans("", "", string.punctuation)
+
+def normalize_message(msg):
+    # Lowercase, drop punctuation and collapse whitespace so trivial edits compare equal
+    return " ".join(msg.lower().translate(_PUNCT_TABLE).split())
+
+def message_hash(msg):
+    return hashlib.sha1(normalize_message(msg).encode("utf-8")).hexdigest()
+
+def simhash(msg, bits=64):
+    # Charikar SimHash over word bigrams of the normalized text
+    words = normalize_message(msg).split()
+    shingles = [" ".join(words[i:i+2]) for i in range(max(len(words) - 1, 1))] if words else [""]
+    weights = [0] * bits
+    for sh in shingles:
+        h = int.from_bytes(hashlib.md5(sh.encode("utf-8")).digest()[:bits // 8], "big")
+        for b in range(bits):
+            weights[b] += 1 if (h >> b) & 1 else -1
+    return sum(1 << b for b in range(bits) if weights[b] > 0)
+
+class MessageIndex:
+    """Hashed index of system messages for constant-time duplicate checks.
+
+    Exact lookups go through the hash of the normalized text. When
+    ``max_distance`` is set, SimHash fingerprints are bucketed into
+    ``max_distance + 1`` bands so any fingerprint within that Hamming
+    distance shares at least one band with a stored one.
+    """
+
+    def __init__(self, max_distance=None, bits=64):
+        self.hashes = {}
+        self.max_distance = max_distance
+        self.bits = bits
+        self.bands = {}
+        if max_distance is not None:
+            self.num_bands = max_distance + 1
+            self.band_width = bits // self.num_bands
+
+    def _band_keys(self, fp):
+        mask = (1 << self.band_width) - 1
+        return [(i, (fp >> (i * self.band_width)) & mask) for i in range(self.num_bands)]
+
+    def add(self, msg, ref=None):
+        h = message_hash(msg)
+        self.hashes[h] = ref
+        if self.max_distance is not None:
+            fp = simhash(msg, self.bits)
+            for key in self._band_keys(fp):
+                self.bands.setdefault(key, []).append((fp, h))
+        return h
+
+    def __contains__(self, msg):
+        return message_hash(msg) in self.hashes
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def find(self, msg):
+        """Return the hash of a stored exact or near duplicate of msg, or None."""
+        h = message_hash(msg)
+        if h in self.hashes:
+            return h
+        if self.max_distance is None:
+            return None
+        fp = simhash(msg, self.bits)
+        for key in self._band_keys(fp):
+            for other_fp, other_h in self.bands.get(key, []):
+                if bin(fp ^ other_fp).count("1") <= self.max_distance:
+                    return other_h
+        return None
+
+    def seen(self, msg):
+        return self.find(msg) is not None
+
+def mutate_prompt(prompt, endpoint, model, system_msg):
     # The system message for the mutation LLM is ONLY the mutation instructions
     mutation_instructions = (
         "You are a precise text mutation machine. Your task is to perform *exact and limited* modifications to the text provided between <INPUT> and </INPUT> tags.\n"
@@ -191,7 +137,7 @@ def mutate_prompt(prompt, url, model, system_msg):
     )
     full_system_msg = mutation_instructions
     user_msg = f"Mutate this: {prompt}"
-    response = call_model(url, model, full_system_msg, [user_msg])
+    response = call_model(endpoint, model, full_system_msg, [user_msg])
     import re
     match = re.search(r"<OUTPUT>(.*?)</OUTPUT>", response, re.S)
     mutation = match.group(1).strip() if match else response.strip()
@@ -206,24 +152,71 @@ def mutate_prompt(prompt, url, model, system_msg):
     label = ";".join(changes)
     return mutation, label
 
-def call_model(url, model, system_msg, dialog, timeout=3):
-    logging.info(f"call_model start: url={url}, model={model}, dialog_len={len(dialog)}")
+def call_model(endpoint, model, system_msg, dialog, timeout=3):
+    # endpoint is a role config section (url or endpoints list) or a bare URL
+    logging.info(f"call_model start: model={model}, dialog_len={len(dialog)}")
     messages = [{"role": "system", "content": system_msg}]
     for i, m in enumerate(dialog):
         role = "user" if i % 2 == 0 else "assistant"
         messages.append({"role": role, "content": m})
     payload = {"model": model, "messages": messages, "stream": False}
     try:
-        resp = requests.post(f"{url}/api/chat", json=payload, timeout=timeout)
-        logging.info(f"call_model response status: {resp.status_code}")
-        resp.raise_for_status()
-        content = resp.json().get("message", {}).get("content", "").strip()
+        data = get_transcript().chat(lambda p: post_chat(endpoint, p, timeout), payload)
+        content = data.get("message", {}).get("content", "").strip()
         logging.info(f"call_model content: {content[:200]}")
         return content if content else "(no response)"
+    except ReplayMiss:
+        raise
     except Exception as e:
         logging.error(f"call_model error: {e}")
         return "(no response)"
 
+def generate_mutants(best_msg, parent_id, epoch_num, base_hist, population_size, config, loser_index, surrogate=None):
+    """Build a population of the parent message plus up to population_size-1 unique mutants.
+
+    Once the surrogate has enough training samples, mutants are oversampled
+    and only the top_k with the highest predicted score are kept for full
+    evaluation. With skip_below_parent, mutants predicted to score below
+    the parent's own prediction are dropped too, keeping at least one.
+    """
+    head_id = f"E{epoch_num}_C1"
+    population = [{"id": head_id, "msg": best_msg, "history": list(base_hist), "parent": parent_id}]
+    population_index = MessageIndex()
+    population_index.add(best_msg, ref=head_id)
+    sur_conf = config.get("surrogate", {})
+    if surrogate is not None and (not surrogate.fitted or len(surrogate) < sur_conf.get("min_samples", 10)):
+        surrogate = None
+    attempts = population_size - 1
+    if surrogate is not None:
+        attempts *= sur_conf.get("oversample", 2)
+    # Ensure mutated messages aren’t duplicates and haven’t lost already been tried (via losers index)
+    mutants = []
+    for _ in range(attempts):
+        m, label = mutate_prompt(
+            best_msg,
+            config["trainee"],
+            config["trainee"]["model"],
+            config["trainee"]["system_message"]
+        )
+        if m not in population_index and not loser_index.seen(m):
+            population_index.add(m)
+            mutants.append((m, label))
+        else:
+            logging.info(f"Rejected duplicate mutant of {head_id}")
+    keep = population_size - 1
+    if surrogate is not None and mutants:
+        scored = sorted(((surrogate.predict(m), m, label) for m, label in mutants), key=lambda x: x[0], reverse=True)
+        keep = min(keep, sur_conf.get("top_k", keep))
+        if sur_conf.get("skip_below_parent", False):
+            # Compare like with like: the parent's predicted score, not its measured one
+            parent_pred = surrogate.predict(best_msg)
+            keep = min(keep, max(1, sum(1 for pred, _, _ in scored if pred >= parent_pred)))
+        mutants = [(m, label) for _, m, label in scored]
+        logging.info(f"Surrogate kept {min(len(mutants), keep)} of {len(mutants)} mutants")
+    for i, (m, label) in enumerate(mutants[:keep], start=2):
+        population.append({"id": f"E{epoch_num}_C{i}", "msg": m, "history": list(base_hist) + [label], "parent": head_id})
+    return population
+
 def format_duration(sec):
     sec = int(sec)
     m, s = divmod(sec, 60)
@@ -235,8 +228,11 @@ def format_duration(sec):
 def main():
     print(f"Starting RL training: epochs={load_config().get('epochs')}, conversations_per_epoch={load_config().get('conversations_per_epoch')}, num_dialog_turns={load_config().get('num_dialog_turns')}")
     config = load_config()
+    # Record or replay LLM calls; the RNG seed is stored so replays take the same path
+    seed = get_transcript(config.get("transcript")).start_session(config.get("seed"))
+    logging.info(f"Transcript mode={get_transcript().mode}, seed={seed}")
     logging.info(f"Configuration loaded: epochs={config.get('epochs')}, conversation_per_epoch={config.get('conversations_per_epoch')}, num_dialog_turns={config.get('num_dialog_turns')}")
-    rules = load_scoring_rules(config["scoring_rules"])
+    score_cache = get_score_cache(config["scoring_rules"], config.get("score_cache_size", 10000))
     starters = extract_starters(config["conversation_files"])
     logging.info(f"Extracted {len(starters)} starters from conversation files")
     logs_dir = "logs"
@@ -247,8 +243,13 @@ def main():
 
     # Lineage tracking for visualization
     lineage = []
-    # Losers tracking to avoid regression
+    # Losers tracking to avoid regression (stored as hash + candidate id; full text lives in lineage)
     losers = []
+    dedup_conf = config.get("dedup", {})
+    max_distance = dedup_conf.get("max_hamming_distance", 3) if dedup_conf.get("near_duplicate", False) else None
+    loser_index = MessageIndex(max_distance=max_distance)
+    # Surrogate score model used to pre-screen mutants before LLM evaluation
+    surrogate = SurrogateModel() if config.get("surrogate", {}).get("enabled", False) else None
     # Archive of evaluated system messages to avoid re-evaluation (persisted)
     evaluated_archive_path = os.path.join(logs_dir, "evaluated_archive.json")
     # Clear previous archive for a fresh start
@@ -260,19 +261,7 @@ def main():
 
     # Initial population: original message + 9 mutants
     best_msg = config["trainee"]["system_message"]
-    population = []
-    population.append({"id": "E1_C1", "msg": best_msg, "history": [], "parent": None})
-    
-    # Ensure mutated messages aren’t duplicates and haven’t lost already been tried (via losers list)
-    for i in range(2, population_size+1):
-        m, label = mutate_prompt(
-            best_msg,
-            config["trainee"]["url"],
-            config["trainee"]["model"],
-            config["trainee"]["system_message"]
-        )
-        if all(m != c["msg"] for c in population) and all(m != loser["msg"] for loser in losers):
-            population.append({"id": f"E1_C{i}", "msg": m, "history": [label], "parent": "E1_C1"})
+    population = generate_mutants(best_msg, None, 1, [], population_size, config, loser_index)
     lineage.append(list(population))
 
     # Evolutionary loop
@@ -285,7 +274,16 @@ def main():
         epoch_start = time.time()
         # Epoch output suppressed
         logging.info(f"--- Epoch {epoch}/{epochs} ---")
+        # Pick up scoring rule edits between epochs; scores from the old rules are
+        # dropped everywhere so the carried-forward winner is re-evaluated under the new ones
+        if score_cache.reload_if_changed():
+            evaluated_messages_archive.clear()
+            if surrogate is not None:
+                surrogate = SurrogateModel()
+            logging.warning("Scoring rules changed, score cache, evaluated archive and surrogate reset")
         candidate_scores = []
+        surrogate_preds = []
+        scorer_stats = {}
         conv_time_sum = 0
         # Evaluate each candidate
         for idx, cand in enumerate(population, start=1):
@@ -307,6 +305,7 @@ def main():
             cid = cand["id"]
             msg = cand["msg"]
             hist = cand["history"]
+            predicted = surrogate.predict(msg) if surrogate is not None and surrogate.fitted else None
             total_score = 0
             dialog = []
             # Single conversation of 'turns' exchanges
@@ -324,13 +323,15 @@ def main():
                 if t % 2 == 0:
                     # Trainee call with error handling
                     try:
-                        resp = call_model(config["trainee"]["url"], config["trainee"]["model"], msg, dialog, timeout=10)
+                        resp = call_model(config["trainee"], config["trainee"]["model"], msg, dialog, timeout=10)
+                    except ReplayMiss:
+                        raise
                     except Exception as e:
                         logging.error(f"[{cid}] Trainee call error: {e}")
                         log_file.write(f"[{cid}] Trainee call error: {e}\n")
                         resp = ""
                     dialog.append(resp)
-                    score = score_response(resp, dialog[-2], rules)
+                    score = score_cache.score(resp, dialog[-2], scorer_stats)
                     total_score += score
                     print(f"[{cid}] Trainee: {resp} (Score: {score:.2f})")
                     logging.info(f"[{cid}] Trainee: {resp} (Score: {score:.2f})")
@@ -338,7 +339,9 @@ def main():
                 else:
                     # Partner call with error handling
                     try:
-                        presp = call_model(config["partner"]["url"], config["partner"]["model"], config["partner"]["system_message"], [dialog[-1]], timeout=10)
+                        presp = call_model(config["partner"], config["partner"]["model"], config["partner"]["system_message"], [dialog[-1]], timeout=10)
+                    except ReplayMiss:
+                        raise
                     except Exception as e:
                         logging.error(f"[{cid}] Partner call error: {e}")
                         log_file.write(f"[{cid}] Partner call error: {e}\n")
@@ -350,6 +353,10 @@ def main():
             avg_score = total_score / (turns//2)
             # Store the evaluated score in archive
             evaluated_messages_archive[msg] = avg_score
+            if surrogate is not None:
+                surrogate.add(msg, avg_score)
+                if predicted is not None:
+                    surrogate_preds.append((predicted, avg_score))
             logging.info(f"[{cid}] Avg Score: {avg_score:.2f}")
             log_file.write(f"[{cid}] Avg Score: {avg_score:.2f}\n")
             logging.info(f"[{cid}] Conversation Duration: {format_duration(time.time()-conv_start)}")
@@ -362,7 +369,7 @@ def main():
             # Update ETA calculations
             conv_time_sum += conv_end - conv_start
             convs_done = idx
-            remaining_convs = population_size - convs_done
+            remaining_convs = len(population) - convs_done
             avg_conv_time = conv_time_sum / convs_done
             epoch_eta_secs = avg_conv_time * remaining_convs
             remaining_epochs = epochs - epoch
@@ -381,8 +388,7 @@ def main():
                 losers.append({
                     "epoch": epoch,
                     "id": cand["id"],
-                    "msg": cand["msg"],
-                    "history": cand["history"],
+                    "hash": loser_index.add(cand["msg"], ref=cand["id"]),
                     "parent": cand["parent"],
                     "last_mutation": cand["history"][-1] if cand["history"] else None,
                     "score": score
@@ -390,6 +396,17 @@ def main():
         logging.info(f"-> Epoch {epoch} Winner: {winner['id']} Score: {win_score:.2f}")
         log_file.write(f"-> Epoch {epoch} Winner: {winner['id']} Score: {win_score:.2f}\n\n")
         print(f"-> Epoch {epoch} Winner: {winner['id']} Score: {win_score:.2f}")
+        if surrogate_preds:
+            mae = sum(abs(p - a) for p, a in surrogate_preds) / len(surrogate_preds)
+            rho = rank_correlation([p for p, _ in surrogate_preds], [a for _, a in surrogate_preds])
+            rho_text = f"{rho:.2f}" if rho is not None else "n/a"
+            logging.info(f"Epoch {epoch} Surrogate MAE: {mae:.2f}, Rank Corr: {rho_text} ({len(surrogate_preds)} candidates)")
+            log_file.write(f"Surrogate MAE: {mae:.2f}, Rank Corr: {rho_text} ({len(surrogate_preds)} candidates)\n\n")
+            print(f"-> Epoch {epoch} Surrogate MAE: {mae:.2f}, Rank Corr: {rho_text} ({len(surrogate_preds)} candidates)")
+        if scorer_stats:
+            log_file.write(f"Scoring rules (time, contribution):\n{scorer_report(scorer_stats)}\n\n")
+        log_file.write(f"Score cache: {score_cache.report()}\n\n")
+        logging.info(f"Epoch {epoch} Score cache: {score_cache.report()}")
         log_file.close()
         logging.info(f"Epoch {epoch} log saved to {epoch_log_path}")
 
@@ -427,28 +444,17 @@ def main():
         logging.info(f"DOT written to {dot_path}")
 
         # Prepare next generation
+        if surrogate is not None:
+            surrogate.fit()
         best_msg = winner["msg"]
-        winner_hist = winner["history"]
-        new_population = []
-        # Winner carries forward
-        new_population.append({"id": f"E{epoch+1}_C1", "msg": best_msg, "history": list(winner_hist), "parent": winner["id"]})
-        
-        for i in range(2, population_size+1):
-            m, label = mutate_prompt(
-                best_msg,
-                config["trainee"]["url"],
-                config["trainee"]["model"],
-                config["trainee"]["system_message"]
-            )
-            if all(m != c["msg"] for c in new_population) and all(m != loser["msg"] for loser in losers):
-                new_hist = winner_hist + [label]
-                new_population.append({"id": f"E{epoch+1}_C{i}", "msg": m, "history": new_hist, "parent": f"E{epoch+1}_C1"})
-        population = new_population
+        population = generate_mutants(best_msg, winner["id"], epoch+1, winner["history"], population_size, config, loser_index, surrogate)
         lineage.append(list(population))
 
         epoch_end = time.time()
         # Epoch duration output suppressed
         logging.info(f"Epoch {epoch} Duration: {format_duration(epoch_end-epoch_start)}")
+        for role in ("trainee", "partner"):
+            logging.info(f"{role} endpoints:\n{get_pool(config[role]).report()}")
         # Visual separation between epochs
         print("\n" * 5, flush=True)
 
@@ -461,6 +467,10 @@ def main():
     else:
         print("No winners recorded.")
 
+    print("=== ENDPOINT STATS ===")
+    for role in ("trainee", "partner"):
+        print(f"{role}:\n{get_pool(config[role]).report()}")
+
     logging.info(f"\nBest system message: {best_msg}")
 
 if __name__ == "__main__":
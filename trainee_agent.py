@@ -1,6 +1,8 @@
 import sys
 import yaml
 import requests
+from recorder import get_transcript, ReplayMiss
+from endpoints import post_chat
 
 def load_config():
     with open("config.yaml", "r") as f:
@@ -22,9 +24,11 @@ def ollama_chat(url, model, system_message, dialog):
 
 def main():
     config = load_config()
-    url = config["trainee"]["url"]
+    # role section with either url or an endpoints list
+    endpoint = config["trainee"]
     model = config["trainee"]["model"]
     sys_msg = config["trainee"]["system_message"]
+    transcript = get_transcript()
     dialog = []  # list of (role_label, message)
     for raw in sys.stdin:
         line = raw.strip()
@@ -47,9 +51,10 @@ def main():
         # call the model
         payload = {"model": model, "messages": messages, "stream": False}
         try:
-            resp = requests.post(f"{url}/api/chat", json=payload, timeout=10)
-            resp.raise_for_status()
-            resp_text = resp.json().get("message", {}).get("content", "").strip()
+            data = transcript.chat(lambda p: post_chat(endpoint, p), payload)
+            resp_text = data.get("message", {}).get("content", "").strip()
+        except ReplayMiss:
+            raise
         except Exception as e:
             resp_text = f"[Error] {e}"
         # append trainee reply and print